@@ -1,4 +1,7 @@
 import asyncio
+import hashlib
+import heapq
+import json
 import logging
 import os
 import shutil
@@ -6,11 +9,15 @@ import sqlite3
 import ssl
 import subprocess
 import tempfile
-import urllib.request
+import threading
+import time
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
+import aiofiles
+import aiohttp
 import certifi
 from PIL import Image
 from zoneinfo import ZoneInfo
@@ -18,15 +25,24 @@ from zoneinfo import ZoneInfo
 # --- pillow_heif optionnel : le bot démarre même si non installé
 try:
     import pillow_heif
+    pillow_heif.register_heif_opener()
     HAVE_HEIF = True
 except Exception:
     HAVE_HEIF = False
 
+# --- uvloop optionnel (Linux) : boucle asyncio plus rapide si installé
+try:
+    import uvloop
+    HAVE_UVLOOP = True
+except ImportError:
+    HAVE_UVLOOP = False
+
 from pyrogram import Client, filters, idle
 from pyrogram.errors import BadRequest, ChatAdminRequired, RPCError
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
 
 import config
+import database
 
 # ---------------- Logging ----------------
 logging.basicConfig(
@@ -39,6 +55,8 @@ logger = logging.getLogger(__name__)
 BASE_DIR = Path(__file__).resolve().parent
 SESSION_DIR = BASE_DIR / "session"
 SESSION_DIR.mkdir(parents=True, exist_ok=True)
+CACHE_DIR = BASE_DIR / "media_cache"
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 # ---------------- Pyrogram Client ----------------
 app_1 = Client(
@@ -51,10 +69,17 @@ app_1 = Client(
 # ---------------- SQLite (uniquement pour planifier les suppressions) ----------------
 DB_PATH = BASE_DIR / "autopost.sqlite3"
 
+_DB: Optional[sqlite3.Connection] = None
+_DB_LOCK = threading.Lock()
+
 def db_init():
-    with sqlite3.connect(DB_PATH) as con:
-        cur = con.cursor()
-        cur.execute("""
+    """Ouvre la connexion unique (WAL, autocommit) et crée la table si besoin."""
+    global _DB
+    _DB = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+    with _DB_LOCK:
+        _DB.execute("PRAGMA journal_mode=WAL")
+        _DB.execute("PRAGMA synchronous=NORMAL")
+        _DB.execute("""
             CREATE TABLE IF NOT EXISTS deletions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 chat_id INTEGER NOT NULL,
@@ -62,32 +87,48 @@ def db_init():
                 delete_at INTEGER NOT NULL
             )
         """)
-        con.commit()
+        _DB.execute("CREATE INDEX IF NOT EXISTS idx_deletions_due ON deletions(delete_at)")
 
-def db_schedule_deletion(chat_id: int, message_id: int, delete_at_ts: int):
-    with sqlite3.connect(DB_PATH) as con:
-        con.execute(
-            "INSERT INTO deletions (chat_id, message_id, delete_at) VALUES (?, ?, ?)",
-            (chat_id, message_id, delete_at_ts)
-        )
-        con.commit()
-
-def db_fetch_due_deletions(now_ts: int, limit: int = 200) -> List[Tuple[int, int, int]]:
-    with sqlite3.connect(DB_PATH) as con:
-        cur = con.cursor()
-        cur.execute(
-            "SELECT id, chat_id, message_id FROM deletions WHERE delete_at <= ? ORDER BY id ASC LIMIT ?",
-            (now_ts, limit)
-        )
-        return cur.fetchall()
+def db_schedule_deletions(rows: List[Tuple[int, int, int]]) -> List[int]:
+    """Insère plusieurs (chat_id, message_id, delete_at) dans une seule transaction. Retourne les ids."""
+    if not rows:
+        return []
+    with _DB_LOCK:
+        _DB.execute("BEGIN")
+        try:
+            ids = [
+                _DB.execute(
+                    "INSERT INTO deletions (chat_id, message_id, delete_at) VALUES (?, ?, ?)",
+                    row
+                ).lastrowid
+                for row in rows
+            ]
+            _DB.execute("COMMIT")
+        except Exception:
+            _DB.execute("ROLLBACK")
+            raise
+    return ids
+
+def db_fetch_pending_deletions() -> List[Tuple[int, int, int, int]]:
+    """Toutes les suppressions en attente : (id, chat_id, message_id, delete_at)."""
+    with _DB_LOCK:
+        return _DB.execute(
+            "SELECT id, chat_id, message_id, delete_at FROM deletions ORDER BY delete_at ASC"
+        ).fetchall()
 
-def db_delete_deletion_row(row_id: int):
-    with sqlite3.connect(DB_PATH) as con:
-        con.execute("DELETE FROM deletions WHERE id=?", (row_id,))
-        con.commit()
+def db_delete_deletion_rows(row_ids: List[int]):
+    if not row_ids:
+        return
+    placeholders = ",".join("?" * len(row_ids))
+    with _DB_LOCK:
+        _DB.execute(f"DELETE FROM deletions WHERE id IN ({placeholders})", row_ids)
 
 db_init()
 
+# ---------------- Limites de concurrence (conversion média) ----------------
+_FFMPEG_SEM = asyncio.Semaphore(max(1, (os.cpu_count() or 2) // 2))
+_PILLOW_SEM = asyncio.Semaphore(os.cpu_count() or 1)
+
 # ---------------- Utils ----------------
 _FR_WEEKDAYS = {
     "lundi": 0, "mardi": 1, "mercredi": 2, "jeudi": 3,
@@ -100,36 +141,41 @@ def _kb(buttons: Optional[List[Tuple[str, str]]]) -> Optional[InlineKeyboardMark
     rows = [[InlineKeyboardButton(text=txt, url=url)] for (txt, url) in buttons]
     return InlineKeyboardMarkup(rows)
 
+_MIME_EXT = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/avif": ".avif",
+    "image/heic": ".heic",
+    "image/heif": ".heif",
+    "video/mp4": ".mp4",
+    "video/quicktime": ".mov",
+}
+
 def _guess_ext_from_content_type(ct: str, default: str = "") -> str:
     if not ct:
         return default
-    m = {
-        "image/jpeg": ".jpg",
-        "image/png": ".png",
-        "image/webp": ".webp",
-        "image/avif": ".avif",
-        "image/heic": ".heic",
-        "image/heif": ".heif",
-        "video/mp4": ".mp4",
-        "video/quicktime": ".mov",
-    }
-    return m.get(ct.split(";")[0].strip().lower(), default)
+    return _MIME_EXT.get(ct.partition(";")[0].strip().lower(), default)
 
-async def _convert_image_if_needed(path: str) -> str:
+# Réglages JPEG de sortie (taille réduite, Telegram recompresse de toute façon)
+_JPEG_SAVE_OPTS = {"quality": 85, "optimize": True, "progressive": True, "subsampling": "4:2:0"}
+
+def _convert_image_sync(path: str) -> str:
     """
     Convertit WebP/HEIC/HEIF/AVIF -> JPEG (si supporté) et réduit si dimensions énormes.
-    Retourne le chemin final (peut être identique).
+    Retourne le chemin final (peut être identique). Bloquant : appeler via un thread.
     """
     try:
-        # active l’opener HEIF seulement si la lib est dispo
-        try:
-            if HAVE_HEIF:
-                pillow_heif.register_heif_opener()
-        except Exception:
-            pass
-
         with Image.open(path) as im:
+            # Image.open ne lit que l'en-tête : format et taille sans décoder les pixels
             fmt = (im.format or "").upper()
+            w, h = im.size
+            max_side = 4096
+
+            # cas courant : JPEG/PNG de taille raisonnable ➜ rien à faire
+            if fmt in ("JPEG", "PNG") and max(w, h) <= max_side:
+                return path
+
             problematic = {"WEBP", "HEIC", "HEIF", "AVIF"}
             # si format “compliqué” et qu’on sait le lire -> on convertit
             if fmt in problematic:
@@ -137,39 +183,168 @@ async def _convert_image_if_needed(path: str) -> str:
                 if fmt in {"HEIC", "HEIF", "AVIF"} and not HAVE_HEIF:
                     return path
                 out = path.rsplit(".", 1)[0] + ".jpg"
-                rgb = im.convert("RGB")
-                max_side = 4096
-                w, h = rgb.size
-                if max(w, h) > max_side:
-                    scale = max_side / float(max(w, h))
-                    rgb = rgb.resize((int(w*scale), int(h*scale)))
-                rgb.save(out, "JPEG", quality=90, optimize=True)
-                return out
-            else:
+            elif max(w, h) > max_side:
                 # JPEG/PNG trop grands ➜ on clamp
-                max_side = 4096
-                w, h = im.size
-                if max(w, h) > max_side:
-                    out = path.rsplit(".", 1)[0] + "_tg.jpg"
-                    rgb = im.convert("RGB")
-                    scale = max_side / float(max(w, h))
-                    rgb = rgb.resize((int(w*scale), int(h*scale)))
-                    rgb.save(out, "JPEG", quality=90, optimize=True)
-                    return out
+                out = path.rsplit(".", 1)[0] + "_tg.jpg"
+                # JPEG : le décodeur réduit déjà pendant la lecture (pas de pleine résolution en RAM)
+                im.draft("RGB", (max_side, max_side))
+            else:
+                return path
+
+            # Pillow redimensionne les modes palette/1 bit en NEAREST : passage en RGB d'abord
+            img = im.convert("RGB") if im.mode in ("1", "P") else im
+            img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            img.convert("RGB").save(out, "JPEG", **_JPEG_SAVE_OPTS)
+            return out
     except Exception as e:
         logger.warning(f"[image] Conversion ignorée ({e})")
     return path
 
+async def _convert_image_if_needed(path: str) -> str:
+    """Version async de _convert_image_sync, exécutée hors de la boucle asyncio."""
+    async with _PILLOW_SEM:
+        return await asyncio.to_thread(_convert_image_sync, path)
+
 def _has_ffmpeg() -> bool:
     return shutil.which("ffmpeg") is not None
 
+def _check_nvenc_available() -> bool:
+    """
+    Vérifie une seule fois que h264_nvenc encode vraiment (1 image de test) :
+    ffmpeg peut lister l'encodeur sans GPU/pilote utilisable.
+    """
+    if not _has_ffmpeg():
+        return False
+    try:
+        res = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error",
+             "-f", "lavfi", "-i", "nullsrc", "-frames:v", "1",
+             "-c:v", "h264_nvenc", "-f", "null", "-"],
+            capture_output=True, timeout=15
+        )
+        return res.returncode == 0
+    except Exception:
+        return False
+
+_NVENC_AVAILABLE = _check_nvenc_available()
+
+def _mp4_has_faststart(path: str) -> bool:
+    """Lit les atomes MP4 de premier niveau : True si 'moov' précède 'mdat'."""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return False
+                size = int.from_bytes(header[:4], "big")
+                kind = header[4:8]
+                if kind == b"moov":
+                    return True
+                if kind == b"mdat":
+                    return False
+                if size == 1:
+                    size = int.from_bytes(f.read(8), "big")
+                    f.seek(size - 16, os.SEEK_CUR)
+                elif size == 0:
+                    return False
+                else:
+                    f.seek(size - 8, os.SEEK_CUR)
+    except Exception:
+        return False
+
+_MP4_BRANDS = ("isom", "iso", "mp4", "avc1", "dash")
+
+@lru_cache(maxsize=64)
+def _probe_video_cached(path: str, mtime: float, size: int) -> Tuple[str, Optional[str], Optional[str], bool]:
+    res = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-show_entries", "stream=codec_type,codec_name:format=format_name:format_tags=major_brand",
+            "-of", "json", path
+        ],
+        capture_output=True, text=True, timeout=30, check=True
+    )
+    info = json.loads(res.stdout or "{}")
+    streams = info.get("streams") or []
+    vcodec = next((st.get("codec_name") for st in streams if st.get("codec_type") == "video"), None)
+    acodec = next((st.get("codec_name") for st in streams if st.get("codec_type") == "audio"), None)
+    fmt_info = info.get("format") or {}
+    fmt = fmt_info.get("format_name") or ""
+    brand = ((fmt_info.get("tags") or {}).get("major_brand") or "").strip().lower()
+    # le démuxeur mov répond "mov,mp4,m4a,3gp,..." : seule la marque distingue un vrai MP4
+    if "mp4" in fmt.split(",") and brand.startswith(_MP4_BRANDS):
+        fmt = "mp4"
+    return fmt, vcodec, acodec, _mp4_has_faststart(path)
+
+def _probe_video(path: str) -> Optional[Tuple[str, Optional[str], Optional[str], bool]]:
+    """
+    Renvoie (format, codec vidéo, codec audio, faststart) via ffprobe, ou None si échec.
+    format vaut "mp4" seulement pour un vrai MP4 (marque isom/mp4*/avc1...), pas pour MOV/3GP.
+    Mis en cache par (chemin, mtime, taille).
+    """
+    if shutil.which("ffprobe") is None:
+        return None
+    try:
+        st = os.stat(path)
+        return _probe_video_cached(path, st.st_mtime, st.st_size)
+    except Exception as e:
+        logger.warning(f"[video] ffprobe échoué ({e})")
+        return None
+
+async def _run_ffmpeg(cmd: List[str]):
+    """
+    Lance ffmpeg sans bloquer la boucle ; lève CalledProcessError si code retour != 0.
+    La fin de stderr (8 Ko) est journalisée en cas d'échec pour savoir pourquoi.
+    """
+    async with _FFMPEG_SEM:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        )
+        _, err = await proc.communicate()
+    if proc.returncode != 0:
+        tail = (err or b"")[-8192:].decode(errors="replace")
+        logger.warning(f"[video] ffmpeg rc={proc.returncode}: {tail}")
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=tail)
+
 async def _convert_video_if_needed(path: str) -> str:
     """
     Normalise en MP4 H.264 + AAC avec moov au début si ffmpeg dispo.
+    Utilise NVENC (GPU) si disponible, sinon libx264.
     """
     if not _has_ffmpeg():
         return path
     out = path.rsplit(".", 1)[0] + "_tg.mp4"
+
+    # Déjà H.264 + AAC ➜ pas de ré-encodage : tel quel si vrai MP4 faststart, sinon remux en MP4
+    async with _FFMPEG_SEM:  # ffprobe compte dans la limite des processus ffmpeg
+        probe = await asyncio.to_thread(_probe_video, path)
+    if probe:
+        fmt, vcodec, acodec, faststart = probe
+        if vcodec == "h264" and acodec in ("aac", None):
+            if fmt == "mp4" and faststart:
+                return path
+            try:
+                cmd = ["ffmpeg", "-y", "-i", path, "-c", "copy", "-movflags", "+faststart", out]
+                await _run_ffmpeg(cmd)
+                return out
+            except Exception as e:
+                logger.warning(f"[video] Remux échoué ({e}), ré-encodage")
+
+    if _NVENC_AVAILABLE:
+        cmd = [
+            "ffmpeg", "-y",
+            "-hwaccel", "cuda", "-hwaccel_output_format", "cuda",
+            "-i", path,
+            "-c:v", "h264_nvenc", "-preset", "p4", "-tune", "ll", "-rc", "vbr", "-cq", "23",
+            "-c:a", "aac", "-b:a", "128k",
+            "-movflags", "+faststart",
+            out
+        ]
+        try:
+            await _run_ffmpeg(cmd)
+            return out
+        except Exception as e:
+            logger.warning(f"[video] NVENC échoué ({e}), repli sur libx264")
     try:
         cmd = [
             "ffmpeg", "-y", "-i", path,
@@ -178,12 +353,85 @@ async def _convert_video_if_needed(path: str) -> str:
             "-movflags", "+faststart",
             out
         ]
-        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        await _run_ffmpeg(cmd)
         return out
     except Exception as e:
         logger.warning(f"[video] Conversion ffmpeg échouée ({e})")
         return path
 
+# ---------------- HTTP (aiohttp, session partagée) ----------------
+_HTTP: Optional[aiohttp.ClientSession] = None
+_DOWNLOAD_CHUNK = 1024 * 1024  # RAM bornée à ~1 Mo par téléchargement
+
+def _get_http() -> aiohttp.ClientSession:
+    """Session HTTP unique, créée à la première utilisation (dans la boucle asyncio)."""
+    global _HTTP
+    if _HTTP is None or _HTTP.closed:
+        connector = aiohttp.TCPConnector(
+            ssl=ssl.create_default_context(cafile=certifi.where()),
+            limit=8,
+        )
+        _HTTP = aiohttp.ClientSession(connector=connector)
+    return _HTTP
+
+async def _close_http():
+    global _HTTP
+    if _HTTP is not None and not _HTTP.closed:
+        await _HTTP.close()
+    _HTTP = None
+
+# ---------------- Cache média (par URL) ----------------
+def _cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+def _is_cached(path: Optional[str]) -> bool:
+    """True si le fichier vit dans CACHE_DIR (ne doit pas être supprimé après envoi)."""
+    if not path:
+        return False
+    try:
+        return Path(path).resolve().is_relative_to(CACHE_DIR)
+    except Exception:
+        return False
+
+def _read_cache_meta(key: str) -> Dict[str, Any]:
+    try:
+        with open(CACHE_DIR / f"{key}.meta", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _write_cache_meta(key: str, meta: Dict[str, Any]):
+    tmp = CACHE_DIR / f"{key}.meta.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, CACHE_DIR / f"{key}.meta")
+
+def _cached_download(key: str) -> Optional[str]:
+    """Chemin du média brut en cache pour cette clé, ou None."""
+    name = _read_cache_meta(key).get("file")
+    if name and (CACHE_DIR / name).exists():
+        return str(CACHE_DIR / name)
+    return None
+
+def _cached_converted(key: str) -> Optional[str]:
+    """Chemin du média déjà converti en cache pour cette clé, ou None."""
+    for p in CACHE_DIR.glob(f"{key}.converted.*"):
+        return str(p)
+    return None
+
+def _store_converted(key: str, conv_path: str) -> str:
+    """Déplace le résultat de conversion dans le cache et renvoie son nouveau chemin."""
+    dest = CACHE_DIR / f"{key}.converted{Path(conv_path).suffix}"
+    shutil.move(conv_path, dest)
+    return str(dest)
+
+def _drop_converted(key: str):
+    for p in CACHE_DIR.glob(f"{key}.converted.*"):
+        try:
+            p.unlink()
+        except Exception:
+            pass
+
 async def _download_if_url(maybe_url: Optional[str]) -> Optional[str]:
     if not maybe_url:
         return None
@@ -193,31 +441,72 @@ async def _download_if_url(maybe_url: Optional[str]) -> Optional[str]:
     if not s.startswith(("http://", "https://")):
         return s
 
+    key = _cache_key(s)
+    meta = _read_cache_meta(key)
+    cached = _cached_download(key)
+
+    headers = {
+        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/124 Safari/537.36",
+        "Accept": "image/*,video/*;q=0.9,*/*;q=0.8",
+        "Referer": "https://my-privatelink.com/",
+    }
+    if cached:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    temp_path = None
     try:
-        req = urllib.request.Request(
-            s,
-            headers={
-                "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/124 Safari/537.36",
-                "Accept": "image/*,video/*;q=0.9,*/*;q=0.8",
-                "Referer": "https://my-privatelink.com/",
-            }
-        )
-        ssl_ctx = ssl.create_default_context(cafile=certifi.where()) if s.startswith("https") else None
-        with urllib.request.urlopen(req, timeout=120, context=ssl_ctx) as resp:
+        async with _get_http().get(s, headers=headers, timeout=aiohttp.ClientTimeout(total=120)) as resp:
+            if resp.status == 304 and cached:
+                return cached
+            resp.raise_for_status()
             ct = resp.headers.get("Content-Type", "")
+            cl = int(resp.headers.get("Content-Length") or 0)
+            # Page HTML ou réponse minuscule ➜ erreur probable, on ne télécharge pas le corps
+            if ct.startswith("text/html") or 0 < cl < 1024:
+                logger.warning(f"Réponse non média ({ct or '?'}, {cl} o), téléchargement ignoré: {s}")
+                return cached
             suffix = _guess_ext_from_content_type(ct, Path(s).suffix or "")
-            fd, temp_path = tempfile.mkstemp(prefix="ap_dl_", suffix=suffix)
-            with os.fdopen(fd, "wb") as f:
-                f.write(resp.read())
+            fd, temp_path = tempfile.mkstemp(prefix="ap_dl_", suffix=suffix, dir=CACHE_DIR)
+            os.close(fd)
+            async with aiofiles.open(temp_path, "wb") as f:
+                async for chunk in resp.content.iter_chunked(_DOWNLOAD_CHUNK):
+                    await f.write(chunk)
+            resp_headers = resp.headers
 
         if os.path.getsize(temp_path) < 1024:
             logger.warning(f"Téléchargement trop petit, probablement HTML/erreur: {s}")
+            os.remove(temp_path)
             return None
 
-        return temp_path
+        # Nouveau contenu ➜ remplace le cache brut et invalide la version convertie
+        dest = CACHE_DIR / f"{key}{suffix}"
+        os.replace(temp_path, dest)
+        if cached and cached != str(dest):
+            try:
+                os.remove(cached)
+            except Exception:
+                pass
+        _drop_converted(key)
+        _write_cache_meta(key, {
+            "url": s,
+            "file": dest.name,
+            "etag": resp_headers.get("ETag"),
+            "last_modified": resp_headers.get("Last-Modified"),
+        })
+        return str(dest)
     except Exception as e:
         logger.warning(f"Téléchargement media KO {s}: {e}")
-        return None
+    if temp_path and os.path.exists(temp_path):
+        try:
+            os.remove(temp_path)
+        except Exception:
+            pass
+    if cached:
+        logger.info(f"[cache] Réutilisation du média en cache pour {s}")
+    return cached
 
 def _seconds_until_next_weekly(weekday_idx: int, hour: int, minute: int, tz_str: str) -> float:
     tz = ZoneInfo(tz_str)
@@ -239,16 +528,23 @@ def _resolve_schedule_tuple(schedule_var_name: str) -> Tuple[int, int, int]:
     hour, minute = map(int, hhmm.strip().split(":"))
     return day_idx, hour, minute
 
+_CHAT_ID_CACHE: Dict[int | str, int] = {}
+
 async def _resolve_chat_id(chat_ref: int | str) -> Optional[int]:
     """
     Accepte un int (-100...) ou un @username.
-    Retourne l'ID numérique (-100...) ou None en cas d'échec.
+    Retourne l'ID numérique (-100...) ou None en cas d'échec (résultat mis en cache).
     """
+    if chat_ref in _CHAT_ID_CACHE:
+        return _CHAT_ID_CACHE[chat_ref]
     try:
         if isinstance(chat_ref, str) and not chat_ref.lstrip("-").isdigit():
             chat = await app_1.get_chat(chat_ref)  # ex: "@mychannel"
-            return chat.id
-        return int(chat_ref)
+            chat_id = chat.id
+        else:
+            chat_id = int(chat_ref)
+        _CHAT_ID_CACHE[chat_ref] = chat_id
+        return chat_id
     except Exception as e:
         logger.warning(f"[resolve] Impossible de résoudre {chat_ref}: {e}")
         return None
@@ -654,42 +950,78 @@ MESSAGES: List[Dict[str, Any]] = [
     # ------------------ FIN COPIE TON LISTING ------------------
 ]
 
+# Champs dérivés calculés une fois (les posts sont statiques)
+for _p in MESSAGES:
+    _p["_markup"] = _kb(_p.get("buttons"))
+    _p["_type"] = (_p.get("type") or "text").lower()
+    _p["_text"] = _p.get("text") or ""
+del _p
+
 # ---------------- Envoi d’un post vers 1 canal ----------------
-async def _send_autopost_to_chat(chat_ref: int | str, post_cfg: Dict[str, Any]) -> Optional[int]:
+_CHAT_SEMS: Dict[int | str, asyncio.Semaphore] = {}
+_MEDIA_LOCKS: Dict[str, asyncio.Lock] = {}
+
+_MEDIA_TYPES = ("photo", "video", "voice", "document")
+
+async def _prepare_media(post_cfg: Dict[str, Any]) -> Tuple[Optional[str], List[str]]:
     """
-    Envoie un post vers chat_ref (int -100... ou @username).
-    Résout d'abord l'ID numérique. Télécharge/convertit les médias si besoin.
+    Télécharge/convertit le média d'un post une seule fois pour tous les canaux.
+    Retourne (chemin prêt à envoyer ou None, fichiers temporaires à supprimer après les envois).
     """
-    ptype = (post_cfg.get("type") or "text").lower()
+    ptype = post_cfg["_type"]
     media = post_cfg.get("media")
-    text = post_cfg.get("text") or ""
-    buttons = post_cfg.get("buttons")
-    markup = _kb(buttons)
+    cleanup: List[str] = []
+    # un seul téléchargement/conversion à la fois par média (dispatchs simultanés du même post)
+    async with _MEDIA_LOCKS.setdefault(str(media), asyncio.Lock()):
+        media_path = await _download_if_url(media)
+        if not media_path:
+            logger.warning(f"[autopost] Média introuvable pour {post_cfg.get('name')}")
+            return None, cleanup
+        if os.path.isabs(media_path):
+            cleanup.append(media_path)
+
+        key = _cache_key(str(media)) if _is_cached(media_path) else None
+        cached_conv = _cached_converted(key) if key else None
+        if cached_conv:
+            media_path = cached_conv
+        elif ptype in ("photo", "video"):
+            if ptype == "photo":
+                conv_path = await _convert_image_if_needed(media_path)
+            else:
+                conv_path = await _convert_video_if_needed(media_path)
+            if key and conv_path and conv_path != media_path:
+                conv_path = _store_converted(key, conv_path)
+            if conv_path:
+                cleanup.append(conv_path)
+            media_path = conv_path or media_path
+    return media_path, cleanup
+
+def _cleanup_media(paths: List[str]):
+    for p in paths:
+        if p and not _is_cached(p) and os.path.exists(p):
+            try:
+                os.remove(p)
+            except Exception:
+                pass
+
+async def _send_autopost_to_chat(
+    chat_ref: int | str, post_cfg: Dict[str, Any], media_path: Optional[str] = None
+) -> Optional[Tuple[int, int]]:
+    """
+    Envoie un post vers chat_ref (int -100... ou @username).
+    Résout d'abord l'ID numérique. media_path : média déjà préparé par _prepare_media.
+    Retourne (message_id, chat_id) ou None en cas d'échec.
+    """
+    ptype = post_cfg["_type"]
+    text = post_cfg["_text"]
+    markup = post_cfg["_markup"]
 
     chat_id = await _resolve_chat_id(chat_ref)
     if chat_id is None:
         logger.warning(f"[autopost] Résolution chat KO pour {chat_ref}")
         return None
 
-    temp_path = None
-    conv_path = None
     try:
-        media_path = None
-        if ptype in ("photo", "video", "voice", "document"):
-            media_path = await _download_if_url(media)
-            if not media_path:
-                logger.warning(f"[autopost] Média introuvable pour {post_cfg.get('name')}")
-                return None
-            if os.path.isabs(media_path):
-                temp_path = media_path
-
-            if ptype == "photo":
-                conv_path = await _convert_image_if_needed(media_path)
-                media_path = conv_path or media_path
-            elif ptype == "video":
-                conv_path = await _convert_video_if_needed(media_path)
-                media_path = conv_path or media_path
-
         if ptype == "text":
             m = await app_1.send_message(chat_id, text or " ", reply_markup=markup)
         elif ptype == "photo":
@@ -703,7 +1035,7 @@ async def _send_autopost_to_chat(chat_ref: int | str, post_cfg: Dict[str, Any])
         else:
             m = await app_1.send_message(chat_id, text or " ", reply_markup=markup)
 
-        return m.id
+        return m.id, chat_id
     except ChatAdminRequired:
         logger.warning(f"[autopost] Pas les droits dans {chat_id} (publier/supprimer).")
     except BadRequest as e:
@@ -712,60 +1044,156 @@ async def _send_autopost_to_chat(chat_ref: int | str, post_cfg: Dict[str, Any])
         logger.warning(f"[autopost] RPCError {chat_id}: {e}")
     except Exception as e:
         logger.warning(f"[autopost] Unexpected {chat_id}: {e}")
-    finally:
-        for p in (conv_path, temp_path):
-            if p and os.path.exists(p):
-                try:
-                    os.remove(p)
-                except Exception:
-                    pass
     return None
 
 # ---------------- Workers ----------------
-async def _autopost_worker(post_cfg: Dict[str, Any]):
-    """Planifie et envoie ce post chaque semaine au jour/heure donnés, dans tous les CHANNEL_IDS."""
+async def _send_one(
+    raw_ref: int | str, post_cfg: Dict[str, Any], media_path: Optional[str]
+) -> Optional[Tuple[int, int]]:
+    """Envoi sérialisé par canal (limites Telegram par chat), parallèle entre canaux."""
+    async with _CHAT_SEMS.setdefault(raw_ref, asyncio.Semaphore(1)):
+        res = await _send_autopost_to_chat(raw_ref, post_cfg, media_path)
+        await asyncio.sleep(0.25)
+        return res
+
+async def _dispatch_post(post_cfg: Dict[str, Any]) -> int:
+    """Envoie un post dans tous les CHANNEL_IDS et planifie sa suppression. Retourne le nb d'envois."""
     tz = ZoneInfo(config.TIMEZONE)
-    wd, h, m = _resolve_schedule_tuple(post_cfg["schedule_var"])
+    media_path, cleanup = None, []
+    if post_cfg["_type"] in _MEDIA_TYPES:
+        media_path, cleanup = await _prepare_media(post_cfg)
+        if not media_path:
+            _cleanup_media(cleanup)
+            return 0
+    try:
+        results = await asyncio.gather(
+            *[_send_one(raw_ref, post_cfg, media_path) for raw_ref in config.CHANNEL_IDS],  # int -100... ou "@username"
+            return_exceptions=True,
+        )
+    finally:
+        _cleanup_media(cleanup)
+    delete_at = int((datetime.now(tz) + timedelta(days=config.AUTO_DELETE_AFTER_DAYS)).timestamp())
+    rows = []
+    for raw_ref, res in zip(config.CHANNEL_IDS, results):
+        if isinstance(res, BaseException):
+            logger.warning(f"[autopost] Envoi KO vers {raw_ref}: {res}")
+        elif res:
+            mid, chat_id = res
+            rows.append((chat_id, mid, delete_at))
+    _schedule_deletions(rows)
+    return len(rows)
 
-    while True:
-        wait_s = _seconds_until_next_weekly(wd, h, m, config.TIMEZONE)
-        logger.info(f"[autopost] {post_cfg['name']} prochain envoi dans {int(wait_s)}s ({post_cfg['schedule_var']}).")
-        await asyncio.sleep(max(1, wait_s))
+_POST_TASKS: set = set()
+
+async def _run_dispatch(post_cfg: Dict[str, Any]):
+    """Envoi d'un post planifié : une erreur est journalisée sans arrêter le planificateur."""
+    try:
+        sent = await _dispatch_post(post_cfg)
+        logger.info(f"[autopost] {post_cfg['name']} envoyé dans {sent} canal(aux).")
+    except Exception as e:
+        logger.warning(f"[autopost] {post_cfg['name']} envoi KO: {e}")
+
+async def _autopost_scheduler():
+    """
+    Tâche unique qui envoie chaque post chaque semaine au jour/heure donnés.
+    File de priorité (heapq) de (timestamp du prochain envoi, index du post).
+    """
+    schedules: Dict[int, Tuple[int, int, int]] = {}
+    heap: List[Tuple[float, int]] = []
+    for idx, post_cfg in enumerate(MESSAGES):
+        try:
+            schedules[idx] = _resolve_schedule_tuple(post_cfg["schedule_var"])
+        except ValueError as e:
+            logger.warning(f"[autopost] {post_cfg['name']} ignoré: {e}")
+            continue
+        wd, h, m = schedules[idx]
+        heap.append((time.time() + _seconds_until_next_weekly(wd, h, m, config.TIMEZONE), idx))
+    heapq.heapify(heap)
+
+    while heap:
+        ts, idx = heap[0]
+        delay = ts - time.time()
+        if delay > 0:
+            # réveil au plus toutes les heures pour rester juste si l'horloge système saute
+            await asyncio.sleep(min(delay, 3600))
+            continue
+        heapq.heappop(heap)
+        post_cfg = MESSAGES[idx]
 
         if not getattr(config, "CHANNEL_IDS", None):
             logger.info("[autopost] Aucun CHANNEL_IDS dans config.py — envoi ignoré.")
         else:
-            sent = 0
-            for raw_ref in config.CHANNEL_IDS:  # int -100... ou "@username"
-                mid = await _send_autopost_to_chat(raw_ref, post_cfg)
-                if mid:
-                    delete_at = int((datetime.now(tz) + timedelta(days=config.AUTO_DELETE_AFTER_DAYS)).timestamp())
-                    chat_id = await _resolve_chat_id(raw_ref)
-                    if chat_id is not None:
-                        db_schedule_deletion(chat_id, mid, delete_at)
-                    sent += 1
-                await asyncio.sleep(0.25)
-            logger.info(f"[autopost] {post_cfg['name']} envoyé dans {sent} canal(aux).")
-
-        # recalcul pour itération suivante
-        wd, h, m = _resolve_schedule_tuple(post_cfg["schedule_var"])
-
-async def _autodelete_worker():
-    """Supprime périodiquement les messages arrivés à échéance (toutes les ~10 min)."""
-    while True:
-        now_ts = int(datetime.now().timestamp())
-        rows = db_fetch_due_deletions(now_ts, limit=200)
-        if rows:
-            logger.info(f"[autodelete] À supprimer: {len(rows)} messages")
-        for row_id, chat_id, message_id in rows:
+            # tâche séparée : un envoi lent (vidéo) ne retarde pas les posts suivants
+            task = asyncio.create_task(_run_dispatch(post_cfg))
+            _POST_TASKS.add(task)
+            task.add_done_callback(_POST_TASKS.discard)
+
+        # prochain créneau recalculé en heure locale (gère les changements d'heure)
+        wd, h, m = schedules[idx]
+        wait_s = _seconds_until_next_weekly(wd, h, m, config.TIMEZONE)
+        logger.info(f"[autopost] {post_cfg['name']} prochain envoi dans {int(wait_s)}s ({post_cfg['schedule_var']}).")
+        heapq.heappush(heap, (time.time() + wait_s, idx))
+
+_DELETE_BATCH = 100
+_DELETE_TASKS: set = set()
+
+async def _delete_rows(rows: List[Tuple[int, int, int]]):
+    """Supprime les messages (row_id, chat_id, message_id) par lots par canal, puis nettoie la table."""
+    logger.info(f"[autodelete] À supprimer: {len(rows)} messages")
+    by_chat: Dict[int, List[Tuple[int, int]]] = {}
+    for row_id, chat_id, message_id in rows:
+        by_chat.setdefault(chat_id, []).append((row_id, message_id))
+    for chat_id, items in by_chat.items():
+        # Telegram accepte jusqu'à 100 messages par appel
+        for i in range(0, len(items), _DELETE_BATCH):
+            batch = items[i:i + _DELETE_BATCH]
             try:
-                await app_1.delete_messages(chat_id, message_id)
+                await app_1.delete_messages(chat_id, [mid for _, mid in batch])
             except Exception as e:
-                logger.warning(f"[autodelete] {chat_id}:{message_id} -> {e}")
+                logger.warning(f"[autodelete] {chat_id}:{[mid for _, mid in batch]} -> {e}")
             finally:
-                db_delete_deletion_row(row_id)
+                db_delete_deletion_rows([rid for rid, _ in batch])
             await asyncio.sleep(0.2)
-        await asyncio.sleep(600)
+
+def _arm_deletion(rows: List[Tuple[int, int, int]], delete_at_ts: int):
+    """Programme la suppression exacte de ces lignes à delete_at_ts (pas de polling)."""
+    def _fire():
+        task = asyncio.create_task(_delete_rows(rows))
+        _DELETE_TASKS.add(task)
+        task.add_done_callback(_DELETE_TASKS.discard)
+    asyncio.get_running_loop().call_later(max(0.0, delete_at_ts - time.time()), _fire)
+
+def _schedule_deletions(rows: List[Tuple[int, int, int]]):
+    """Enregistre (chat_id, message_id, delete_at) en base et arme les timers correspondants."""
+    ids = db_schedule_deletions(rows)
+    by_due: Dict[int, List[Tuple[int, int, int]]] = {}
+    for row_id, (chat_id, message_id, delete_at) in zip(ids, rows):
+        by_due.setdefault(delete_at, []).append((row_id, chat_id, message_id))
+    for delete_at, due_rows in by_due.items():
+        _arm_deletion(due_rows, delete_at)
+
+def _restore_pending_deletions():
+    """
+    Au démarrage : les suppressions échues partent en un seul lot (groupé par canal),
+    les autres sont réarmées sur leur échéance.
+    """
+    now = time.time()
+    overdue: List[Tuple[int, int, int]] = []
+    by_due: Dict[int, List[Tuple[int, int, int]]] = {}
+    for row_id, chat_id, message_id, delete_at in db_fetch_pending_deletions():
+        if delete_at <= now:
+            overdue.append((row_id, chat_id, message_id))
+        else:
+            by_due.setdefault(delete_at, []).append((row_id, chat_id, message_id))
+    if overdue:
+        _arm_deletion(overdue, 0)
+    for delete_at, rows in by_due.items():
+        _arm_deletion(rows, delete_at)
+    if overdue or by_due:
+        logger.info(
+            f"[autodelete] {len(overdue)} suppression(s) échue(s), "
+            f"{sum(len(r) for r in by_due.values())} réarmée(s)"
+        )
 
 # ---------------- Commandes admin (test & debug) ----------------
 @app_1.on_message(filters.command("force_post_index") & filters.user(config.ADMIN_ID))
@@ -780,17 +1208,7 @@ async def force_post_index_handler(client: Client, message: Message):
         return await message.reply_text("Index invalide.")
     if not getattr(config, "CHANNEL_IDS", None):
         return await message.reply_text("Aucun CHANNEL_IDS dans config.py.")
-    tz = ZoneInfo(config.TIMEZONE)
-    sent = 0
-    for raw_ref in config.CHANNEL_IDS:
-        mid = await _send_autopost_to_chat(raw_ref, post)
-        if mid:
-            delete_at = int((datetime.now(tz) + timedelta(days=config.AUTO_DELETE_AFTER_DAYS)).timestamp())
-            chat_id = await _resolve_chat_id(raw_ref)
-            if chat_id is not None:
-                db_schedule_deletion(chat_id, mid, delete_at)
-            sent += 1
-        await asyncio.sleep(0.25)
+    sent = await _dispatch_post(post)
     await message.reply_text(f"OK: post {idx} envoyé dans {sent} canal(aux).")
 
 @app_1.on_message(filters.command("start") & filters.user(config.ADMIN_ID))
@@ -831,34 +1249,43 @@ async def _preflight_check():
         logger.warning(f"[preflight] Erreur globale: {e}")
 
 # ---------------- Main (Pyrogram v2) ----------------
+_SCHEDULER_TASK: Optional[asyncio.Task] = None
+
 async def main():
+    await database.init_db()
+    database.start_writer()
     await app_1.start()
 
     # Préflight immédiat
     await _preflight_check()
 
-    # Lancer un worker par post
-    for post_cfg in MESSAGES:
-        asyncio.create_task(_autopost_worker(post_cfg))
+    # Lancer le planificateur des posts (une seule tâche pour tous)
+    global _SCHEDULER_TASK
+    _SCHEDULER_TASK = asyncio.create_task(_autopost_scheduler())
 
-    # Lancer le worker de suppression
-    asyncio.create_task(_autodelete_worker())
+    # Réarmer les suppressions planifiées
+    _restore_pending_deletions()
 
     # Log de sanity check statique
     try:
         for p in MESSAGES:
             day, hm = getattr(config, p["schedule_var"])
-            logger.info(f"[startup] {p['name']} -> {day} {hm}")
-        logger.info(f"[startup] CHANNEL_IDS = {getattr(config, 'CHANNEL_IDS', [])}")
+            logger.info("[startup] %s -> %s %s", p["name"], day, hm)
+        channel_ids = getattr(config, "CHANNEL_IDS", [])
+        logger.info("[startup] CHANNEL_IDS = %s", channel_ids)
     except Exception:
         pass
 
     await idle()
+    await database.flush()
     await app_1.stop()
+    await _close_http()
 
 if __name__ == "__main__":
     try:
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(main())
+        if HAVE_UVLOOP:
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         pass
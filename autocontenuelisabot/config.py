@@ -1,3 +1,5 @@
+import os
+
 # ----- Identifiants Telegram -----
 API_ID = "14703744"
 API_HASH = "f49c3172164036fbf04432e096d444e8"
@@ -13,6 +15,12 @@ CHANNEL_IDS = [
     # -1009876543210,
 ]
 
+# ----- Base utilisateurs (SQLite) -----
+# Surcharge possible via la variable d'environnement BOT_DB_URL, par ex. :
+#   sqlite+aiosqlite:////dev/shm/lisa.sqlite3  -> base en RAM (tmpfs), déploiement sans état
+#   sqlite+aiosqlite:///:memory:               -> tests
+DB_URL = os.environ.get("BOT_DB_URL", "sqlite+aiosqlite:///database/db.sqlite3")
+
 # ----- Fuseau & suppression -----
 TIMEZONE = "Europe/Malta"   # ex: "Europe/Paris"
 AUTO_DELETE_AFTER_DAYS = 7  # suppression au bout d'1 semaine
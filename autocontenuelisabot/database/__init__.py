@@ -1,46 +1,237 @@
-from sqlalchemy import create_engine, Column, Integer, TEXT
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+import asyncio
+import logging
+import sqlite3
+from contextlib import asynccontextmanager
 
+from sqlalchemy import Column, Integer, String, event, lambda_stmt, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 
-engine = create_engine('sqlite:///database/db.sqlite3')
+import config
 
 
-Session = sessionmaker(bind=engine)
+DB_URL = config.DB_URL
+if DB_URL.startswith('sqlite://'):
+    # moteur async : on force le driver aiosqlite
+    DB_URL = 'sqlite+aiosqlite://' + DB_URL[len('sqlite://'):]
+
+if ':memory:' in DB_URL:
+    # une seule connexion, sinon chaque connexion verrait sa propre base vide
+    _pool_args = {"poolclass": StaticPool}
+else:
+    # WAL autorise des lectures concurrentes : un vrai pool plutôt qu'une connexion unique
+    _pool_args = {
+        "poolclass": AsyncAdaptedQueuePool,
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_pre_ping": True,
+    }
+
+engine = create_async_engine(
+    DB_URL,
+    connect_args={"check_same_thread": False},
+    **_pool_args,
+)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-20000")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+@asynccontextmanager
+async def get_session():
+    """Session avec commit en sortie normale et rollback en cas d'erreur."""
+    async with Session() as session:
+        try:
+            yield session
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
 
 
 Base = declarative_base()
 
+logger = logging.getLogger(__name__)
+
+# user_id déjà présents en base (évite un SELECT à chaque message)
+_known_users: set[int] = set()
+
+# nouveaux utilisateurs en attente d'écriture groupée
+_pending: "asyncio.Queue[tuple[int, str, str]]" = asyncio.Queue()
+_BATCH_MAX = 500
+_FLUSH_INTERVAL = 2.0
+_writer_task: "asyncio.Task | None" = None
+
 class User(Base):
     __tablename__ = 'users'
-    id = Column(Integer,primary_key=True)
-    user_id = Column(Integer)
-    first_name = Column(TEXT)
-    username = Column(TEXT,nullable=True)
+    # table organisée directement en B-tree sur user_id (pas de rowid)
+    __table_args__ = {'sqlite_with_rowid': False}
+    user_id = Column(Integer,primary_key=True,autoincrement=False)
+    first_name = Column(String(64),nullable=False,default="")
+    username = Column(String(64),nullable=True)
 
 
     def __init__(self,user_id,first_name,username):
-        self.user_id = user_id
-        self.first_name = first_name
-        self.username = username
+        self.user_id = int(user_id)
+        self.first_name = (first_name or "")[:64]
+        self.username = username[:64] if username else None
 
         
 
 
     
     @classmethod
-    def add_user_to_db(cls,user_id,first_name,username):
-        with Session() as session:
-            user = session.query(cls).filter(cls.user_id == user_id).first()
-            if not user:
-                session.add(cls(user_id,first_name,username,))
-                session.commit()
+    async def add_user_to_db(cls,user_id,first_name,username):
+        user_id = int(user_id)
+        if user_id in _known_users:
+            return
+        # écriture différée : la tâche run_writer() insère par lots
+        _known_users.add(user_id)
+        _pending.put_nowait((user_id,(first_name or "")[:64],username[:64] if username else None))
 
     @classmethod
-    def get_user(cls):
-        with Session() as session:
-            return session.query(cls).all()
+    async def get_user(cls):
+        async with get_session() as session:
+            result = await session.execute(_GET_ALL_USERS)
+            return result.scalars().all()
+
+    @classmethod
+    async def get_user_ids(cls):
+        """Seulement les user_id (liste d'int), sans objets ORM : suffisant pour un envoi groupé."""
+        async with get_session() as session:
+            result = await session.execute(select(cls.user_id))
+            return result.scalars().all()
+
+    @classmethod
+    async def iter_users(cls,chunk=500):
+        """Parcourt les utilisateurs par paquets de `chunk` (async for) sans tout charger en mémoire."""
+        async with get_session() as session:
+            result = await session.stream(select(cls).execution_options(yield_per=chunk))
+            async for user in result.scalars():
+                yield user
+
+    @classmethod
+    async def raw_scan(cls):
+        """
+        Parcourt (user_id, first_name, username) en sqlite3.Row directement via le driver,
+        sans SQLAlchemy ni objets ORM : le plus léger pour un envoi groupé.
+        """
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            async with raw.driver_connection.execute(
+                f"SELECT user_id, first_name, username FROM {cls.__tablename__}"
+            ) as cursor:
+                cursor.row_factory = sqlite3.Row
+                async for row in cursor:
+                    yield row
+
+
+# requête compilée une fois puis réutilisée depuis le cache SQLAlchemy
+_GET_ALL_USERS = lambda_stmt(lambda: select(User))
+
+
+_INSERT_USER = sqlite_insert(User.__table__).on_conflict_do_nothing(index_elements=['user_id'])
+
+async def _write_batch(batch):
+    # Core + executemany : une requête préparée, une transaction, aucun état ORM par ligne
+    async with engine.begin() as conn:
+        await conn.execute(
+            _INSERT_USER,
+            [{'user_id':u,'first_name':f,'username':n} for (u,f,n) in batch]
+        )
+
+async def _write_and_ack(batch):
+    try:
+        await _write_batch(batch)
+    except Exception as e:
+        logger.warning(f"[users] Écriture de {len(batch)} utilisateur(s) KO: {e}")
+        # pas en base : on les laissera réessayer au prochain message
+        for (u,_,_) in batch:
+            _known_users.discard(u)
+    finally:
+        for _ in batch:
+            _pending.task_done()
+
+async def run_writer():
+    """Vide la file _pending par lots (jusqu'à _BATCH_MAX lignes, au plus toutes les _FLUSH_INTERVAL s)."""
+    while True:
+        batch = [await _pending.get()]
+        await asyncio.sleep(_FLUSH_INTERVAL)
+        while len(batch) < _BATCH_MAX:
+            try:
+                batch.append(_pending.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        await _write_and_ack(batch)
+
+def start_writer():
+    """Lance la tâche d'écriture groupée (à appeler depuis la boucle asyncio)."""
+    global _writer_task
+    if _writer_task is None or _writer_task.done():
+        _writer_task = asyncio.create_task(run_writer())
+
+async def flush():
+    """Écrit tout ce qui est en attente puis arrête la tâche d'écriture (à l'arrêt du bot)."""
+    global _writer_task
+    if _writer_task is not None and not _writer_task.done():
+        await _pending.join()
+        _writer_task.cancel()
+        _writer_task = None
+    while not _pending.empty():
+        batch = []
+        while len(batch) < _BATCH_MAX and not _pending.empty():
+            batch.append(_pending.get_nowait())
+        await _write_and_ack(batch)
+
+# à incrémenter à chaque changement de schéma de la table users
+_SCHEMA_VERSION = 1
 
+def _migrate_users(conn):
+    """
+    Anciens schémas (id auto + user_id, ou table avec rowid) ➜ user_id en clé primaire,
+    table WITHOUT ROWID. Reconstruit la table en copiant les lignes.
+    """
+    cols = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(users)")]
+    if not cols:
+        return
+    ddl = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name='users'"
+    ).scalar() or ""
+    if 'id' not in cols and 'WITHOUT ROWID' in ddl.upper():
+        # first_name n'accepte plus NULL
+        conn.exec_driver_sql("UPDATE users SET first_name='' WHERE first_name IS NULL")
+        return
+    conn.exec_driver_sql("ALTER TABLE users RENAME TO users_old")
+    User.__table__.create(conn)
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO users (user_id, first_name, username) "
+        "SELECT user_id, substr(COALESCE(first_name, ''), 1, 64), substr(username, 1, 64) "
+        "FROM users_old WHERE user_id IS NOT NULL ORDER BY rowid"
+    )
+    conn.exec_driver_sql("DROP TABLE users_old")
 
-Base.metadata.create_all(engine)
-session = Session()
+async def init_db():
+    """Migration, création du schéma et préchargement des user_id. À appeler une fois depuis main()."""
+    async with engine.begin() as conn:
+        # marqueur stocké dans la base : migration/DDL seulement si le schéma n'est pas à jour
+        version = (await conn.exec_driver_sql("PRAGMA user_version")).scalar() or 0
+        if version < _SCHEMA_VERSION:
+            await conn.run_sync(_migrate_users)
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.exec_driver_sql(f"PRAGMA user_version={_SCHEMA_VERSION}")
+    # une seule lecture au démarrage : ensuite add_user_to_db ne fait qu'un test `in`
+    _known_users.update(await User.get_user_ids())
+    logger.info(f"[users] {len(_known_users)} utilisateur(s) connus chargés")